@@ -6,7 +6,13 @@ import os
 import requests
 from dotenv import load_dotenv
 import logging
-import random
+import time
+import click
+from tmdb_index import PREFIX_TOP_N, TitleIndexStore, build_index
+from recommender import ContentRanker, library_weight
+from tmdb_scheduler import (
+    BACKGROUND, INTERACTIVE, RECOMMENDATION, TMDBBackpressure, TMDBScheduler, parse_retry_after
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -46,6 +52,30 @@ except Exception as e:
 # TMDB API configuration
 TMDB_API_KEY = os.getenv('TMDB_API_KEY')
 TMDB_BASE_URL = 'https://api.themoviedb.org/3'
+TMDB_TIMEOUT = float(os.getenv('TMDB_TIMEOUT', '10'))
+
+# TMDB's rate limit applies to the whole deployment, so each worker gets its share
+TMDB_WORKERS = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+tmdb_scheduler = TMDBScheduler(
+    rate=float(os.getenv('TMDB_RATE_LIMIT', '40')) / TMDB_WORKERS,
+    burst=max(1.0, float(os.getenv('TMDB_RATE_BURST', '20')) / TMDB_WORKERS)
+)
+
+# Local title index built from TMDB's daily ID exports (see `flask tmdb-index`)
+TMDB_INDEX_DIR = os.getenv('TMDB_INDEX_DIR', app.instance_path)
+title_indexes = TitleIndexStore(TMDB_INDEX_DIR)
+for media_type in ('movie', 'tv'):
+    title_indexes.load(media_type)
+
+# Candidate pools for the recommendation routes, kept for the life of the worker
+RECOMMENDATION_SEEDS_PER_REQUEST = 3
+recommendation_rankers = {
+    'movie': ContentRanker(),
+    'tv': ContentRanker(),
+}
+resolved_tmdb_ids = {}  # (media_type, title) -> TMDB id, or None when TMDB has no match
+SEED_FAILURE_TTL = 6 * 60 * 60  # Seconds a library item TMDB rejected is left out of seeding
+failed_seeds = {}  # (media_type, title) -> time of the last 4xx for that item
 
 class Movie(db.Document):
     meta = {'collection': 'movies'}
@@ -111,6 +141,53 @@ class TVShow(db.Document):
             'updated_at': self.updated_at.isoformat()
         }
 
+def tmdb_get(path, params=None, priority=INTERACTIVE):
+    """GET a TMDB endpoint through the shared rate-limit scheduler.
+
+    A 429 pauses the scheduler for the Retry-After period. Interactive and
+    recommendation requests then retry once; background requests give up straight away.
+    """
+    attempts = 1 if priority == BACKGROUND else 2
+    for attempt in range(attempts):
+        tmdb_scheduler.acquire(priority)
+        response = requests.get(
+            f'{TMDB_BASE_URL}{path}',
+            params={'api_key': TMDB_API_KEY, **(params or {})},
+            timeout=TMDB_TIMEOUT
+        )
+        if response.status_code != 429:
+            return response
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        logger.warning(f"TMDB rate limited {path}, pausing for {retry_after:.1f}s")
+        tmdb_scheduler.pause(retry_after, priority)
+    raise TMDBBackpressure('TMDB rate limit exceeded', retry_after=retry_after)
+
+def backpressure_response(e):
+    response = jsonify({'error': str(e)})
+    if e.retry_after:
+        response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+    return response, 503
+
+def local_title_response(media_type, query, error):
+    """Answer a search from the local title index when TMDB cannot.
+
+    The index is keyed on original-language titles, so a hit can be a different work
+    than TMDB's localized search would return; it is only used when TMDB fails.
+    """
+    index = title_indexes.get(media_type)
+    match = index.exact(query) if index else None
+    if not match:
+        return None
+    logger.warning(f"TMDB {media_type} search failed, answering from the local title index: {str(error)}")
+    return jsonify({
+        'id': match['id'],
+        'title': match['title'],
+        'year': None,
+        'poster_url': None,
+        'overview': None,
+        'tmdb_id': match['id']
+    })
+
 @app.route('/')
 def health_check():
     return jsonify({"message": "Movie Tracker API is running"})
@@ -122,14 +199,20 @@ def search_tmdb():
         return jsonify({'error': 'Query parameter is required'}), 400
 
     try:
-        response = requests.get(
-            f'{TMDB_BASE_URL}/search/movie',
-            params={
-                'api_key': TMDB_API_KEY,
-                'query': query
-            }
-        )
-        data = response.json()
+        try:
+            response = tmdb_get(
+                '/search/movie',
+                params={
+                    'query': query
+                }
+            )
+            response.raise_for_status()
+            data = response.json()
+        except (TMDBBackpressure, requests.RequestException, ValueError) as e:
+            fallback = local_title_response('movie', query, e)
+            if fallback:
+                return fallback
+            raise
         
         if data.get('results'):
             movie = data['results'][0]  # Get the first result
@@ -142,6 +225,8 @@ def search_tmdb():
                 'tmdb_id': movie['id']  # Add TMDB ID to response
             })
         return jsonify({'error': 'No results found'}), 404
+    except TMDBBackpressure as e:
+        return backpressure_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -242,6 +327,121 @@ def delete_movie(id):
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+def resolve_tmdb_id(media_type, title, priority=RECOMMENDATION):
+    """Find the TMDB id for a library title.
+
+    Only TMDB's own search results are cached. When TMDB fails, an exact match in the
+    local title index is used for this call alone, so it is corrected once TMDB answers.
+    """
+    key = (media_type, title)
+    if key in resolved_tmdb_ids:
+        return resolved_tmdb_ids[key]
+
+    try:
+        search_response = tmdb_get(
+            f'/search/{media_type}',
+            params={
+                'query': title
+            },
+            priority=priority
+        )
+        # Only a successful search may be cached, including a definitive "no match"
+        search_response.raise_for_status()
+        search_data = search_response.json()
+    except (TMDBBackpressure, requests.RequestException, ValueError):
+        index = title_indexes.get(media_type)
+        match = index.exact(title) if index else None
+        if match:
+            return match['id']
+        raise
+
+    tmdb_id = search_data['results'][0]['id'] if search_data.get('results') else None
+    resolved_tmdb_ids[key] = tmdb_id
+    return tmdb_id
+
+def format_recommendation_candidate(media_type, result):
+    if media_type == 'movie':
+        title, date = result['title'], result.get('release_date')
+        payload = {}
+    else:
+        title, date = result['name'], result.get('first_air_date')
+        payload = {'id': str(result['id'])}  # Convert to string to match MongoDB ObjectId format
+    payload.update({
+        'title': title,
+        'year': date[:4] if date else None,
+        'poster_url': f"https://image.tmdb.org/t/p/w500{result['poster_path']}" if result.get('poster_path') else None,
+        'overview': result.get('overview'),
+        'rating': round(result.get('vote_average', 0) / 2)  # Convert 10-point scale to 5-point scale
+    })
+    return {
+        'tmdb_id': result['id'],
+        'genre_ids': result.get('genre_ids', []),
+        'overview': result.get('overview'),
+        'year': int(date[:4]) if date else None,
+        'vote_average': result.get('vote_average'),
+        'payload': payload
+    }
+
+def rank_recommendations(media_type, library, limit=10):
+    """Rank the candidate pool against the library, expanding a few new seeds per call.
+
+    Each library item is expanded once per worker with a single details call that also
+    returns its TMDB recommendations, so a fully expanded library is ranked with no
+    upstream traffic at all. Once the pool can fill a page, further expansion is
+    background work and stops as soon as the scheduler sheds it.
+    """
+    ranker = recommendation_rankers[media_type]
+    for item in library:
+        if not item.get('tmdb_id'):
+            item['tmdb_id'] = resolved_tmdb_ids.get((media_type, item['title']))
+
+    # Expand the items that shape the profile most first, in a stable order
+    now = time.monotonic()
+    pending = [
+        item for item in library
+        if not ranker.has_seed(item.get('tmdb_id'))
+        and (item.get('tmdb_id') or (media_type, item['title']) not in resolved_tmdb_ids)
+        and now - failed_seeds.get((media_type, item['title']), -SEED_FAILURE_TTL) >= SEED_FAILURE_TTL
+    ]
+    pending.sort(key=lambda item: (-library_weight(item.get('rating'), item.get('status')), item['title']))
+    for item in pending[:RECOMMENDATION_SEEDS_PER_REQUEST]:
+        priority = BACKGROUND if len(ranker) >= limit else RECOMMENDATION
+        try:
+            tmdb_id = item.get('tmdb_id') or resolve_tmdb_id(media_type, item['title'], priority)
+            if not tmdb_id:
+                continue
+            item['tmdb_id'] = tmdb_id
+
+            details_response = tmdb_get(
+                f'/{media_type}/{tmdb_id}',
+                params={
+                    'append_to_response': 'recommendations'
+                },
+                priority=priority
+            )
+            # A failed details call must not mark the seed as expanded
+            details_response.raise_for_status()
+            details_data = details_response.json()
+        except (TMDBBackpressure, requests.RequestException, ValueError) as e:
+            # A 4xx is about this item alone (e.g. a stale tmdb_id): skip it for a while
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if isinstance(e, requests.HTTPError) and status and 400 <= status < 500:
+                failed_seeds[(media_type, item['title'])] = now
+                logger.warning(f"Skipping {media_type} seed {item['title']}: {str(e)}")
+                continue
+            # Upstream trouble only stops the expansion; rank whatever the pool already holds
+            if not len(ranker):
+                raise
+            logger.warning(f"Skipping {media_type} recommendation seeds: {str(e)}")
+            break
+        ranker.add_candidates(
+            format_recommendation_candidate(media_type, result)
+            for result in details_data.get('recommendations', {}).get('results', [])
+        )
+        ranker.add_seed(tmdb_id, [genre['id'] for genre in details_data.get('genres', [])])
+
+    return ranker.rank(library, limit=limit)
+
 @app.route('/api/tmdb/recommendations', methods=['GET'])
 def get_recommendations():
     try:
@@ -249,55 +449,11 @@ def get_recommendations():
         movies = Movie.objects.all()
         if not movies:
             return jsonify({'error': 'No movies in watchlist to base recommendations on'}), 404
-        
-        # Get multiple random movies from the list (up to 3)
-        num_movies = min(3, len(movies))
-        random_movies = random.sample(list(movies), num_movies)
-        
-        all_recommendations = []
-        seen_titles = set()  # To avoid duplicates
-        
-        for random_movie in random_movies:
-            # Search TMDB for the movie to get its ID
-            search_response = requests.get(
-                f'{TMDB_BASE_URL}/search/movie',
-                params={
-                    'api_key': TMDB_API_KEY,
-                    'query': random_movie.title
-                }
-            )
-            search_data = search_response.json()
-            
-            if not search_data.get('results'):
-                continue
-                
-            movie_id = search_data['results'][0]['id']
-            
-            # Get recommendations based on the movie
-            recommendations_response = requests.get(
-                f'{TMDB_BASE_URL}/movie/{movie_id}/recommendations',
-                params={
-                    'api_key': TMDB_API_KEY,
-                    'page': random.randint(1, 3)  # Random page for more variety
-                }
-            )
-            recommendations_data = recommendations_response.json()
-            
-            # Format the recommendations
-            for movie in recommendations_data.get('results', []):
-                if movie['title'] not in seen_titles:
-                    seen_titles.add(movie['title'])
-                    all_recommendations.append({
-                        'title': movie['title'],
-                        'year': movie['release_date'][:4] if movie['release_date'] else None,
-                        'poster_url': f"https://image.tmdb.org/t/p/w500{movie['poster_path']}" if movie['poster_path'] else None,
-                        'overview': movie['overview'],
-                        'rating': round(movie['vote_average'] / 2)  # Convert 10-point scale to 5-point scale
-                    })
-        
-        # Shuffle the recommendations and take top 10
-        random.shuffle(all_recommendations)
-        return jsonify(all_recommendations[:10])
+
+        library = [movie.to_dict() for movie in movies]
+        return jsonify(rank_recommendations('movie', library))
+    except TMDBBackpressure as e:
+        return backpressure_response(e)
     except Exception as e:
         logger.error(f"Error fetching recommendations: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -309,14 +465,20 @@ def search_tmdb_tv():
         return jsonify({'error': 'Query parameter is required'}), 400
 
     try:
-        response = requests.get(
-            f'{TMDB_BASE_URL}/search/tv',
-            params={
-                'api_key': TMDB_API_KEY,
-                'query': query
-            }
-        )
-        data = response.json()
+        try:
+            response = tmdb_get(
+                '/search/tv',
+                params={
+                    'query': query
+                }
+            )
+            response.raise_for_status()
+            data = response.json()
+        except (TMDBBackpressure, requests.RequestException, ValueError) as e:
+            fallback = local_title_response('tv', query, e)
+            if fallback:
+                return fallback
+            raise
         
         if data.get('results'):
             show = data['results'][0]  # Get the first result
@@ -329,6 +491,8 @@ def search_tmdb_tv():
                 'tmdb_id': show['id']  # Add TMDB ID to response
             })
         return jsonify({'error': 'No results found'}), 404
+    except TMDBBackpressure as e:
+        return backpressure_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -417,56 +581,11 @@ def get_tv_recommendations():
         tvshows = TVShow.objects.all()
         if not tvshows:
             return jsonify({'error': 'No TV shows in watchlist to base recommendations on'}), 404
-        
-        # Get multiple random shows from the list (up to 3)
-        num_shows = min(3, len(tvshows))
-        random_shows = random.sample(list(tvshows), num_shows)
-        
-        all_recommendations = []
-        seen_titles = set()  # To avoid duplicates
-        
-        for random_show in random_shows:
-            # Search TMDB for the show to get its ID
-            search_response = requests.get(
-                f'{TMDB_BASE_URL}/search/tv',
-                params={
-                    'api_key': TMDB_API_KEY,
-                    'query': random_show.title
-                }
-            )
-            search_data = search_response.json()
-            
-            if not search_data.get('results'):
-                continue
-                
-            show_id = search_data['results'][0]['id']
-            
-            # Get recommendations based on the show
-            recommendations_response = requests.get(
-                f'{TMDB_BASE_URL}/tv/{show_id}/recommendations',
-                params={
-                    'api_key': TMDB_API_KEY,
-                    'page': random.randint(1, 3)  # Random page for more variety
-                }
-            )
-            recommendations_data = recommendations_response.json()
-            
-            # Format the recommendations
-            for show in recommendations_data.get('results', []):
-                if show['name'] not in seen_titles:
-                    seen_titles.add(show['name'])
-                    all_recommendations.append({
-                        'id': str(show['id']),  # Convert to string to match MongoDB ObjectId format
-                        'title': show['name'],
-                        'year': show['first_air_date'][:4] if show['first_air_date'] else None,
-                        'poster_url': f"https://image.tmdb.org/t/p/w500{show['poster_path']}" if show['poster_path'] else None,
-                        'overview': show['overview'],
-                        'rating': round(show['vote_average'] / 2)  # Convert 10-point scale to 5-point scale
-                    })
-        
-        # Shuffle the recommendations and take top 10
-        random.shuffle(all_recommendations)
-        return jsonify(all_recommendations[:10])
+
+        library = [tvshow.to_dict() for tvshow in tvshows]
+        return jsonify(rank_recommendations('tv', library))
+    except TMDBBackpressure as e:
+        return backpressure_response(e)
     except Exception as e:
         logger.error(f"Error fetching TV recommendations: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -475,12 +594,7 @@ def get_tv_recommendations():
 def get_trailer(type, id):
     try:
         if type == 'movie':
-            response = requests.get(
-                f'{TMDB_BASE_URL}/movie/{id}/videos',
-                params={
-                    'api_key': TMDB_API_KEY
-                }
-            )
+            response = tmdb_get(f'/movie/{id}/videos')
             data = response.json()
             
             if data.get('results'):
@@ -496,12 +610,7 @@ def get_trailer(type, id):
 
         elif type == 'tv':
             # First try to get the show's videos
-            response = requests.get(
-                f'{TMDB_BASE_URL}/tv/{id}/videos',
-                params={
-                    'api_key': TMDB_API_KEY
-                }
-            )
+            response = tmdb_get(f'/tv/{id}/videos')
             data = response.json()
             
             if data.get('results'):
@@ -515,12 +624,7 @@ def get_trailer(type, id):
                     })
 
             # If no show trailer found, try to get season 1 trailer
-            season_response = requests.get(
-                f'{TMDB_BASE_URL}/tv/{id}/season/1/videos',
-                params={
-                    'api_key': TMDB_API_KEY
-                }
-            )
+            season_response = tmdb_get(f'/tv/{id}/season/1/videos')
             season_data = season_response.json()
             
             if season_data.get('results'):
@@ -534,12 +638,7 @@ def get_trailer(type, id):
                     })
 
             # If still no trailer found, try to get episode 1 trailer
-            episode_response = requests.get(
-                f'{TMDB_BASE_URL}/tv/{id}/season/1/episode/1/videos',
-                params={
-                    'api_key': TMDB_API_KEY
-                }
-            )
+            episode_response = tmdb_get(f'/tv/{id}/season/1/episode/1/videos')
             episode_data = episode_response.json()
             
             if episode_data.get('results'):
@@ -556,9 +655,46 @@ def get_trailer(type, id):
         else:
             return jsonify({'error': 'Invalid type. Must be "movie" or "tv"'}), 400
 
+    except TMDBBackpressure as e:
+        return backpressure_response(e)
     except Exception as e:
         logger.error(f"Error fetching trailer: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/tmdb/<type>/suggest', methods=['GET'])
+def suggest_titles(type):
+    if type not in ('movie', 'tv'):
+        return jsonify({'error': 'Invalid type. Must be "movie" or "tv"'}), 400
+    query = request.args.get('query')
+    if not query:
+        return jsonify({'error': 'Query parameter is required'}), 400
+
+    try:
+        limit = min(int(request.args.get('limit', 10)), PREFIX_TOP_N)
+    except ValueError:
+        return jsonify({'error': 'Limit must be an integer'}), 400
+
+    index = title_indexes.get(type)
+    if not index:
+        return jsonify({'error': f'No local {type} title index available'}), 503
+
+    return jsonify([
+        {'title': match['title'], 'tmdb_id': match['id'], 'popularity': match['popularity']}
+        for match in index.prefix(query, limit=limit)
+    ])
+
+@app.route('/api/tmdb/scheduler', methods=['GET'])
+def tmdb_scheduler_metrics():
+    return jsonify(tmdb_scheduler.metrics())
+
+@app.cli.command('tmdb-index')
+@click.argument('media_type', type=click.Choice(['movie', 'tv']))
+@click.argument('export_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--include-adult', is_flag=True, help='Keep entries flagged as adult.')
+def tmdb_index_command(media_type, export_path, include_adult):
+    """Build the local title index from a TMDB daily ID export file."""
+    count = build_index(export_path, TMDB_INDEX_DIR, media_type, include_adult=include_adult)
+    click.echo(f'Indexed {count} {media_type} titles into {TMDB_INDEX_DIR}; restart the app to serve it')
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,217 @@
+import re
+import threading
+import zlib
+
+import numpy as np
+
+# Feature layout: [genres | hashed overview terms]. Rows are kept at 128 floats because
+# scoring is one memory-bound matrix-vector product over the whole pool.
+GENRE_DIM = 32
+TEXT_DIM = 96
+FEATURE_DIM = GENRE_DIM + TEXT_DIM
+
+# Relative weight of each signal in the final score
+GENRE_WEIGHT = 1.0
+TEXT_WEIGHT = 0.6
+VOTE_WEIGHT = 0.3
+YEAR_WEIGHT = 0.2
+YEAR_SCALE = 15.0  # Years away from the library's preferred year before the year signal halves
+UNKNOWN_YEAR = -1e6  # Far enough from any real year that its year signal is ~0
+
+# How much each library item pulls the profile towards its features
+STATUS_WEIGHTS = {
+    'Watched': 0.5,
+    'Watching': 0.6,
+    'Want to Watch': 0.4,
+}
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from', 'has', 'have', 'he',
+    'her', 'his', 'in', 'into', 'is', 'it', 'its', 'of', 'on', 'or', 'she', 'that', 'the', 'their',
+    'they', 'this', 'to', 'was', 'when', 'who', 'will', 'with',
+))
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def library_weight(rating, status):
+    """Weight of a library item in the user's profile.
+
+    Explicit 1-5 ratings win over status: 3 is neutral, lower ratings push the profile away.
+    """
+    if rating:
+        return (rating - 3) / 2.0
+    return STATUS_WEIGHTS.get(status, 0.4)
+
+
+def hash_terms(text):
+    """Hashed, l2-normalized term frequencies of an overview."""
+    vector = np.zeros(TEXT_DIM, dtype=np.float32)
+    if not text:
+        return vector
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) > 2 and token not in STOPWORDS:
+            vector[zlib.crc32(token.encode('utf-8')) % TEXT_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ContentRanker:
+    """Scores a growing pool of TMDB candidates against the user's library.
+
+    Candidates are kept as rows of a dense float32 matrix that grows in place, so adding
+    the results of a new upstream call never rebuilds the existing features.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._genre_columns = {}
+        self._rows = {}  # tmdb_id -> row
+        self._payloads = []
+        self._size = 0
+        self._features = np.zeros((capacity, FEATURE_DIM), dtype=np.float32)
+        self._votes = np.zeros(capacity, dtype=np.float32)
+        self._years = np.full(capacity, UNKNOWN_YEAR, dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._doc_freq = np.zeros(TEXT_DIM, dtype=np.float32)
+        # Seeds are library items whose genres (and recommendations) we already fetched
+        self._seed_genres = {}  # tmdb_id -> genre vector
+        # Hashed overview terms of library items, keyed by (tmdb_id, overview)
+        self._library_terms = {}
+
+    def __len__(self):
+        return self._size
+
+    def _genre_vector(self, genre_ids):
+        vector = np.zeros(GENRE_DIM, dtype=np.float32)
+        for genre_id in genre_ids or ():
+            column = self._genre_columns.get(genre_id)
+            if column is None:
+                if len(self._genre_columns) >= GENRE_DIM:
+                    continue
+                column = self._genre_columns[genre_id] = len(self._genre_columns)
+            vector[column] = 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _grow(self):
+        capacity = self._features.shape[0] * 2
+        self._features = np.resize(self._features, (capacity, FEATURE_DIM))
+        self._votes = np.resize(self._votes, capacity)
+        self._years = np.resize(self._years, capacity)
+        self._ids = np.resize(self._ids, capacity)
+
+    def add_seed(self, tmdb_id, genre_ids):
+        with self._lock:
+            self._seed_genres[tmdb_id] = self._genre_vector(genre_ids)
+
+    def has_seed(self, tmdb_id):
+        return tmdb_id in self._seed_genres
+
+    def add_candidates(self, candidates):
+        """Insert or refresh candidates.
+
+        Each candidate is a dict with `tmdb_id`, `genre_ids`, `overview`, `year`,
+        `vote_average` (0-10) and the `payload` returned to the client.
+        """
+        with self._lock:
+            for candidate in candidates:
+                tmdb_id = candidate['tmdb_id']
+                row = self._rows.get(tmdb_id)
+                if row is None:
+                    if self._size == self._features.shape[0]:
+                        self._grow()
+                    row = self._rows[tmdb_id] = self._size
+                    self._payloads.append(candidate['payload'])
+                    self._size += 1
+                else:
+                    self._doc_freq -= self._features[row, GENRE_DIM:] > 0
+                    self._payloads[row] = candidate['payload']
+
+                terms = hash_terms(candidate.get('overview'))
+                self._features[row, :GENRE_DIM] = self._genre_vector(candidate.get('genre_ids'))
+                self._features[row, GENRE_DIM:] = terms
+                self._doc_freq += terms > 0
+                self._votes[row] = (candidate.get('vote_average') or 0) / 10.0
+                self._years[row] = candidate.get('year') or UNKNOWN_YEAR
+                self._ids[row] = tmdb_id
+
+    def _profile(self, library):
+        """Weighted sum of library features, plus the weighted mean release year.
+
+        Term vectors are cached per (tmdb_id, overview) and the cache is trimmed to the
+        current library, so only new or edited items are tokenized.
+        """
+        no_genres = np.zeros(GENRE_DIM, dtype=np.float32)
+        library_terms = {}
+        weights, genres, terms = [], [], []
+        year_total = year_weight = 0.0
+        for item in library:
+            weight = library_weight(item.get('rating'), item.get('status'))
+            key = (item.get('tmdb_id'), item.get('overview'))
+            vector = self._library_terms.get(key)
+            if vector is None:
+                vector = hash_terms(item.get('overview'))
+            library_terms[key] = vector
+            if not weight:
+                continue
+            weights.append(weight)
+            genres.append(self._seed_genres.get(item.get('tmdb_id'), no_genres))
+            terms.append(vector)
+            if item.get('year') and weight > 0:
+                year_total += weight * item['year']
+                year_weight += weight
+        self._library_terms = library_terms
+
+        profile = np.zeros(FEATURE_DIM, dtype=np.float32)
+        if weights:
+            weights = np.array(weights, dtype=np.float32)
+            profile[:GENRE_DIM] = weights @ np.array(genres)
+            profile[GENRE_DIM:] = weights @ np.array(terms)
+        preferred_year = year_total / year_weight if year_weight else None
+        return profile, preferred_year
+
+    def rank(self, library, limit=10):
+        """Return the top `limit` candidate payloads for the library, best first.
+
+        Items already in the library are excluded. Ties are broken by TMDB id so the
+        same library and pool always produce the same list.
+        """
+        with self._lock:
+            size = self._size
+            if not size:
+                return []
+            features = self._features[:size]
+            ids = self._ids[:size]
+
+            profile, preferred_year = self._profile(library)
+            # TF-IDF: rows hold plain term frequencies, so idf is applied to both sides via the profile
+            idf = np.log((1.0 + size) / (1.0 + self._doc_freq)) + 1.0
+            genre_norm = np.linalg.norm(profile[:GENRE_DIM])
+            if genre_norm:
+                profile[:GENRE_DIM] *= GENRE_WEIGHT / genre_norm
+            text_profile = profile[GENRE_DIM:] * idf * idf
+            text_norm = np.linalg.norm(text_profile)
+            profile[GENRE_DIM:] = text_profile * (TEXT_WEIGHT / text_norm) if text_norm else 0.0
+
+            scores = features @ profile
+            scores += VOTE_WEIGHT * self._votes[:size]
+            if preferred_year is not None:
+                year_scores = np.abs(self._years[:size] - np.float32(preferred_year))
+                year_scores *= 1.0 / YEAR_SCALE
+                year_scores += 1.0
+                scores += YEAR_WEIGHT / year_scores
+
+            library_rows = [self._rows[item['tmdb_id']] for item in library if item.get('tmdb_id') in self._rows]
+            scores[library_rows] = -np.inf
+
+            limit = min(limit, size)
+            if limit < size:
+                # Keep everything tied with the k-th score so the id tie-break below stays stable
+                cutoff = -np.partition(-scores, limit - 1)[limit - 1]
+                top = np.flatnonzero(scores >= cutoff)
+            else:
+                top = np.arange(size)
+            # lexsort uses the last key as primary: score descending, then id ascending
+            top = top[np.lexsort((ids[top], -scores[top]))][:limit]
+            return [self._payloads[row] for row in top if np.isfinite(scores[row])]
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    """The Flask app module, importable without reaching MongoDB."""
+    pytest.importorskip('flask_mongoengine')
+    # A plain URI avoids the SRV lookup the default Atlas URI does on import; nothing connects
+    monkeypatch.setenv('MONGODB_URI', 'mongodb://localhost:27017')
+    import app
+    return app
@@ -0,0 +1,132 @@
+import numpy as np
+import requests
+
+from recommender import TEXT_DIM, ContentRanker, hash_terms
+
+
+def candidate(tmdb_id, overview='space alien war', genre_ids=(878,), year=2000, vote_average=7.0):
+    return {
+        'tmdb_id': tmdb_id,
+        'genre_ids': list(genre_ids),
+        'overview': overview,
+        'year': year,
+        'vote_average': vote_average,
+        'payload': {'tmdb_id': tmdb_id},
+    }
+
+
+def ranked_ids(ranker, library, limit=10):
+    return [payload['tmdb_id'] for payload in ranker.rank(library, limit=limit)]
+
+
+LIBRARY = [{'tmdb_id': 1, 'rating': 5, 'status': 'Watched', 'overview': 'space alien war', 'year': 2000}]
+
+
+def test_hash_terms_is_normalized_and_ignores_stopwords():
+    vector = hash_terms('The alien and the ALIEN')
+    assert vector.shape == (TEXT_DIM,)
+    assert np.count_nonzero(vector) == 1
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+    assert not hash_terms('').any()
+
+
+def test_refreshing_a_candidate_keeps_doc_freq_in_sync():
+    ranker = ContentRanker()
+    ranker.add_candidates([candidate(10, overview='space alien war'), candidate(11, overview='heist crime')])
+    ranker.add_candidates([candidate(10, overview='love story wedding')])
+
+    expected = ContentRanker()
+    expected.add_candidates([candidate(10, overview='love story wedding'), candidate(11, overview='heist crime')])
+
+    assert len(ranker) == 2
+    np.testing.assert_array_equal(ranker._doc_freq, expected._doc_freq)
+    assert ranker._doc_freq.min() >= 0
+
+
+def test_pool_grows_past_initial_capacity():
+    ranker = ContentRanker(capacity=2)
+    ranker.add_candidates([candidate(tmdb_id) for tmdb_id in range(10, 17)])
+
+    assert len(ranker) == 7
+    assert ranker._features.shape[0] >= 7
+    assert sorted(ranked_ids(ranker, LIBRARY)) == list(range(10, 17))
+
+
+def test_library_items_are_excluded():
+    ranker = ContentRanker()
+    ranker.add_candidates([candidate(1), candidate(10), candidate(11)])
+
+    # Fewer candidates than the limit: excluded rows must be dropped, not returned last
+    assert 1 not in ranked_ids(ranker, LIBRARY, limit=10)
+    assert 1 not in ranked_ids(ranker, LIBRARY, limit=1)
+    assert ranked_ids(ranker, [dict(LIBRARY[0], tmdb_id=10), dict(LIBRARY[0], tmdb_id=11), LIBRARY[0]]) == []
+
+
+def test_ties_are_broken_by_tmdb_id():
+    forward, backward = ContentRanker(), ContentRanker()
+    ids = [42, 7, 19, 3]
+    forward.add_candidates([candidate(tmdb_id) for tmdb_id in ids])
+    backward.add_candidates([candidate(tmdb_id) for tmdb_id in reversed(ids)])
+
+    assert ranked_ids(forward, LIBRARY) == [3, 7, 19, 42]
+    assert ranked_ids(backward, LIBRARY) == [3, 7, 19, 42]
+    assert ranked_ids(forward, LIBRARY, limit=2) == [3, 7]
+
+
+def test_profile_prefers_similar_candidates():
+    ranker = ContentRanker()
+    ranker.add_seed(1, [878])
+    ranker.add_candidates([
+        candidate(10, overview='romantic wedding comedy', genre_ids=(10749,), year=1960),
+        candidate(11, overview='alien war in space', genre_ids=(878,), year=2001),
+    ])
+
+    assert ranked_ids(ranker, LIBRARY) == [11, 10]
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error', response=self)
+
+    def json(self):
+        return self._data
+
+
+def test_rank_recommendations_skips_items_tmdb_rejects(monkeypatch, app_module):
+    app = app_module
+    monkeypatch.setattr(app, 'recommendation_rankers', {'movie': ContentRanker()})
+    monkeypatch.setattr(app, 'resolved_tmdb_ids', {})
+    monkeypatch.setattr(app, 'failed_seeds', {})
+    calls = []
+
+    def fake_tmdb_get(path, params=None, priority=None):
+        calls.append(path)
+        if path == '/movie/404':
+            return FakeResponse(404)
+        return FakeResponse(200, {
+            'genres': [{'id': 878}],
+            'recommendations': {'results': [
+                {'id': 900, 'title': 'Found', 'release_date': '2001-01-01', 'poster_path': None,
+                 'overview': 'space', 'vote_average': 8.0, 'genre_ids': [878]},
+            ]},
+        })
+
+    monkeypatch.setattr(app, 'tmdb_get', fake_tmdb_get)
+    library = [
+        {'title': 'Bad', 'tmdb_id': 404, 'rating': 5, 'status': 'Watched', 'overview': 'space', 'year': 2000},
+        {'title': 'Good', 'tmdb_id': 500, 'rating': 4, 'status': 'Watched', 'overview': 'space', 'year': 2000},
+    ]
+
+    assert [movie['title'] for movie in app.rank_recommendations('movie', library)] == ['Found']
+    assert calls == ['/movie/404', '/movie/500']
+    assert app.recommendation_rankers['movie'].has_seed(500)
+    assert not app.recommendation_rankers['movie'].has_seed(404)
+
+    # The rejected item is remembered and no longer takes a seed slot
+    app.rank_recommendations('movie', library)
+    assert calls == ['/movie/404', '/movie/500']
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import tmdb_index
+from tmdb_index import TitleIndex, TitleIndexStore, build_index, index_path, normalize_title
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'movie_ids_export.json.gz')
+
+
+@pytest.fixture
+def index(tmp_path):
+    build_index(FIXTURE, str(tmp_path), 'movie')
+    return TitleIndex.load(index_path(str(tmp_path), 'movie'))
+
+
+def test_normalize_title():
+    assert normalize_title('  Amélie!! ') == 'amelie'
+    assert normalize_title('Spider-Man: No Way Home') == 'spider man no way home'
+    assert normalize_title('기생충') == ''
+    assert normalize_title(None) == ''
+
+
+def test_build_index_skips_adult_malformed_and_untitled(tmp_path):
+    count = build_index(FIXTURE, str(tmp_path), 'movie')
+    index = TitleIndex.load(index_path(str(tmp_path), 'movie'))
+
+    assert count == len(index) == 7
+    ids = set(index.ids.tolist())
+    assert 7777 not in ids  # adult
+    assert 8888 not in ids  # empty title
+    assert 496243 not in ids  # title normalizes to nothing
+
+
+def test_build_index_can_keep_adult(tmp_path):
+    assert build_index(FIXTURE, str(tmp_path), 'movie', include_adult=True) == 8
+
+
+def test_build_index_rejects_unknown_media_type(tmp_path):
+    with pytest.raises(ValueError):
+        build_index(FIXTURE, str(tmp_path), 'person')
+
+
+def test_exact_picks_most_popular_duplicate(index):
+    assert index.exact('the matrix') == {'id': 603, 'title': 'The Matrix', 'popularity': 80.5}
+    assert index.exact('AMELIE')['id'] == 194
+    assert index.exact('matrix') is None
+    assert index.exact('') is None
+
+
+def test_prefix_orders_by_popularity_and_limits(index):
+    assert [match['id'] for match in index.prefix('the mat')] == [603, 604, 605, 9990]
+    assert [match['id'] for match in index.prefix('The Matrix Re', limit=1)] == [604]
+    assert index.prefix('the mat', limit=0) == []
+    assert index.prefix('zzz') == []
+
+
+def test_prefix_table_matches_range_scan(tmp_path, monkeypatch, index):
+    monkeypatch.setattr(tmdb_index, 'PREFIX_RANGE_LIMIT', 1)
+    build_index(FIXTURE, str(tmp_path / 'small'), 'movie')
+    precomputed = TitleIndex.load(index_path(str(tmp_path / 'small'), 'movie'))
+
+    assert 'the mat' in precomputed._prefixes
+    for query in ('t', 'the', 'the mat', 'm', 'a'):
+        assert precomputed.prefix(query, limit=3) == index.prefix(query, limit=3)
+
+
+def test_store_loads_existing_indexes_only(tmp_path):
+    build_index(FIXTURE, str(tmp_path), 'movie')
+    store = TitleIndexStore(str(tmp_path))
+
+    assert store.get('movie') is None
+    assert store.load('movie') is store.get('movie')
+    assert store.load('tv') is None
+    assert store.get('tv') is None
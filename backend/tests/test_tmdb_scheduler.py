@@ -0,0 +1,110 @@
+import threading
+import time
+from email.utils import formatdate
+from unittest import mock
+
+import pytest
+
+from tmdb_index import TitleIndexStore
+from tmdb_scheduler import (
+    BACKGROUND, INTERACTIVE, TMDBBackpressure, TMDBScheduler, parse_retry_after
+)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not reached'
+        time.sleep(0.005)
+
+
+def queued(scheduler, name):
+    return scheduler.metrics()['classes'][name]['queued']
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TMDBScheduler(rate=0, burst=10)
+
+
+def test_reserve_is_clamped_to_the_bucket():
+    assert TMDBScheduler(rate=10, burst=4).background_reserve == 2.0
+    assert TMDBScheduler(rate=2, burst=1).background_reserve == 0.0
+
+
+def test_interactive_requests_jump_queued_background_ones():
+    scheduler = TMDBScheduler(rate=20, burst=1)
+    scheduler.pause(0.2)
+    granted = []
+
+    def request(priority):
+        scheduler.acquire(priority)
+        granted.append(priority)
+
+    threads = [threading.Thread(target=request, args=(BACKGROUND,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: queued(scheduler, 'background') == 3)
+    threads.append(threading.Thread(target=request, args=(INTERACTIVE,)))
+    threads[-1].start()
+    wait_for(lambda: queued(scheduler, 'interactive') == 1)
+    for thread in threads:
+        thread.join()
+
+    assert granted == [INTERACTIVE, BACKGROUND, BACKGROUND, BACKGROUND]
+
+
+def test_background_is_shed_while_only_the_reserve_is_left():
+    scheduler = TMDBScheduler(rate=0.01, burst=4, max_wait={BACKGROUND: 0.1})
+    scheduler.acquire(INTERACTIVE)
+    scheduler.acquire(INTERACTIVE)
+
+    with pytest.raises(TMDBBackpressure) as excinfo:
+        scheduler.acquire(BACKGROUND)
+    assert excinfo.value.retry_after > 0
+
+    # The reserve is still there for interactive traffic
+    scheduler.acquire(INTERACTIVE)
+    classes = scheduler.metrics()['classes']
+    assert classes['background']['shed'] == 1
+    assert classes['interactive']['granted'] == 3
+
+
+def test_pause_stops_refill_until_it_ends():
+    scheduler = TMDBScheduler(rate=100, burst=1)
+    scheduler.acquire(INTERACTIVE)
+    scheduler.pause(0.2)
+
+    time.sleep(0.1)
+    metrics = scheduler.metrics()
+    assert metrics['tokens'] == 0
+    assert metrics['paused_for'] > 0
+
+    start = time.monotonic()
+    scheduler.acquire(INTERACTIVE)
+    assert time.monotonic() - start >= 0.08
+    assert scheduler.metrics()['classes']['interactive']['throttled'] == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('-5') == 0.0
+    assert parse_retry_after(None) == 1.0
+    assert parse_retry_after('soon', default=2.0) == 2.0
+    assert 28 <= parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
+
+
+def test_search_returns_503_after_repeated_429s(monkeypatch, app_module):
+    app = app_module
+    monkeypatch.setattr(app, 'tmdb_scheduler', TMDBScheduler(rate=100, burst=10))
+    monkeypatch.setattr(app, 'title_indexes', TitleIndexStore('/nonexistent'))
+    rate_limited = mock.Mock(status_code=429, headers={'Retry-After': '0.05'})
+
+    with mock.patch.object(app.requests, 'get', return_value=rate_limited) as get:
+        response = app.app.test_client().get('/api/tmdb/search?query=heat')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert get.call_count == 2
+    assert app.tmdb_scheduler.metrics()['classes']['interactive']['throttled'] == 2
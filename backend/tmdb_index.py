@@ -0,0 +1,267 @@
+import bisect
+import gzip
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import unicodedata
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# TMDB daily ID exports name the title field differently per media type
+EXPORT_TITLE_FIELDS = {
+    'movie': 'original_title',
+    'tv': 'original_name',
+}
+
+# On-disk layout: magic, header length, JSON header, then raw arrays starting at the next
+# 8-byte boundary; array offsets in the header are relative to that data section
+INDEX_MAGIC = b'TMDBIDX1'
+INDEX_ARRAYS = ('key_offsets', 'keys', 'title_offsets', 'titles', 'ids', 'popularity')
+
+# Prefixes matching more rows than this get their top entries precomputed, so a
+# prefix lookup never ranks more than PREFIX_RANGE_LIMIT rows at query time
+PREFIX_RANGE_LIMIT = 1024
+PREFIX_TOP_N = 50
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_title(title):
+    """Lowercase, strip accents and collapse punctuation/whitespace to single spaces."""
+    if not title:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', title)
+    ascii_title = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(' ', ascii_title.lower()).strip()
+
+
+def index_path(index_dir, media_type):
+    return os.path.join(index_dir, f'tmdb_{media_type}_index.bin')
+
+
+def _blob(strings):
+    """Concatenate UTF-8 strings into a byte array plus n+1 offsets."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def _top_rows(popularity, lo, hi, limit):
+    """Rows in [lo, hi) with the highest popularity, ties broken by row (i.e. by key)."""
+    rows = np.arange(lo, hi)
+    pops = popularity[lo:hi]
+    if hi - lo > limit:
+        cutoff = -np.partition(-pops, limit - 1)[limit - 1]
+        keep = pops >= cutoff
+        rows, pops = rows[keep], pops[keep]
+    return rows[np.lexsort((rows, -pops))][:limit]
+
+
+def _prefix_table(keys, popularity):
+    """Top rows for every prefix whose sorted range is longer than PREFIX_RANGE_LIMIT."""
+    table = {}
+    stack = [('', 0, len(keys))]
+    while stack:
+        prefix, lo, hi = stack.pop()
+        depth = len(prefix)
+        i = lo
+        while i < hi and len(keys[i]) == depth:
+            i += 1  # Keys equal to the prefix itself sort first and have no child
+        while i < hi:
+            child = prefix + keys[i][depth]
+            j = bisect.bisect_left(keys, child + '\uffff', i, hi)
+            if j - i > PREFIX_RANGE_LIMIT:
+                table[child] = _top_rows(popularity, i, j, PREFIX_TOP_N).tolist()
+                stack.append((child, i, j))
+            i = j
+    return table
+
+
+def build_index(export_path, index_dir, media_type, include_adult=False):
+    """Load a TMDB ID export (gzipped NDJSON) and write a sorted title index.
+
+    Returns the number of entries written.
+    """
+    if media_type not in EXPORT_TITLE_FIELDS:
+        raise ValueError(f'Invalid media type: {media_type}')
+    title_field = EXPORT_TITLE_FIELDS[media_type]
+
+    entries = []
+    skipped = 0
+    with gzip.open(export_path, 'rt', encoding='utf-8') as export_file:
+        for line in export_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if record.get('adult') and not include_adult:
+                continue
+            title = record.get(title_field)
+            key = normalize_title(title)
+            if not key or 'id' not in record:
+                skipped += 1
+                continue
+            entries.append((key, -float(record.get('popularity') or 0), record['id'], title))
+
+    # Sort by key, then by popularity (descending) so the best exact match comes first
+    entries.sort()
+
+    keys = [entry[0] for entry in entries]
+    popularity = np.array([-entry[1] for entry in entries], dtype=np.float32)
+    key_offsets, key_blob = _blob(keys)
+    title_offsets, title_blob = _blob(entry[3] for entry in entries)
+    arrays = {
+        'key_offsets': key_offsets,
+        'keys': key_blob,
+        'title_offsets': title_offsets,
+        'titles': title_blob,
+        'ids': np.array([entry[2] for entry in entries], dtype=np.int32),
+        'popularity': popularity,
+    }
+
+    layout = {}
+    offset = 0
+    for name in INDEX_ARRAYS:
+        offset += -offset % 8
+        layout[name] = {'offset': offset, 'dtype': arrays[name].dtype.str, 'length': len(arrays[name])}
+        offset += arrays[name].nbytes
+    header_bytes = json.dumps({
+        'media_type': media_type,
+        'count': len(entries),
+        'arrays': layout,
+        'prefixes': _prefix_table(keys, popularity),
+    }, separators=(',', ':')).encode('utf-8')
+    preamble = INDEX_MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes
+    data_start = len(preamble) + -len(preamble) % 8
+
+    os.makedirs(index_dir, exist_ok=True)
+    path = index_path(index_dir, media_type)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(preamble)
+        for name in INDEX_ARRAYS:
+            index_file.write(b'\0' * (data_start + layout[name]['offset'] - index_file.tell()))
+            index_file.write(arrays[name].tobytes())
+    os.replace(tmp_path, path)
+
+    logger.info(f"Built {media_type} title index with {len(entries)} entries ({skipped} skipped) at {path}")
+    return len(entries)
+
+
+class TitleIndex:
+    """Read-only title index over memory-mapped arrays sorted by normalized title.
+
+    The arrays stay on disk and are shared through the page cache by every worker;
+    only the header and the precomputed prefix table are loaded into memory.
+    """
+
+    def __init__(self, arrays, prefixes, buffer=None):
+        self._buffer = buffer  # Keeps the mapping alive for the arrays viewing it
+        self._key_offsets = arrays['key_offsets']
+        self._keys = arrays['keys']
+        self._title_offsets = arrays['title_offsets']
+        self._titles = arrays['titles']
+        self.ids = arrays['ids']
+        self.popularity = arrays['popularity']
+        self._prefixes = prefixes
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as index_file:
+            if index_file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f'{path} is not a TMDB title index')
+            (header_length,) = struct.unpack('<Q', index_file.read(8))
+            header = json.loads(index_file.read(header_length))
+            data_start = index_file.tell() + -index_file.tell() % 8
+            buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        arrays = {
+            name: np.frombuffer(buffer, dtype=spec['dtype'], count=spec['length'], offset=data_start + spec['offset'])
+            for name, spec in header['arrays'].items()
+        }
+        return cls(arrays, header['prefixes'], buffer)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _key(self, i):
+        return self._keys[self._key_offsets[i]:self._key_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def _bisect(self, key, lo=0):
+        hi = len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _entry(self, i):
+        return {
+            'id': int(self.ids[i]),
+            'title': self._titles[self._title_offsets[i]:self._title_offsets[i + 1]].tobytes().decode('utf-8'),
+            'popularity': float(self.popularity[i]),
+        }
+
+    def exact(self, query):
+        """Return the most popular entry whose normalized title equals the query.
+
+        Keys come from the export's original-language titles, so an exact hit can be a
+        different work than the one TMDB's localized search ranks first.
+        """
+        key = normalize_title(query)
+        if not key:
+            return None
+        i = self._bisect(key)
+        if i < len(self) and self._key(i) == key:
+            return self._entry(i)
+        return None
+
+    def prefix(self, query, limit=10):
+        """Return up to `limit` entries whose normalized title starts with the query, most popular first."""
+        key = normalize_title(query)
+        if not key or limit <= 0:
+            return []
+        rows = self._prefixes.get(key)
+        if rows is None:
+            lo = self._bisect(key)
+            hi = self._bisect(key + '\uffff', lo)
+            rows = _top_rows(self.popularity, lo, hi, limit)
+        return [self._entry(i) for i in rows[:limit]]
+
+
+class TitleIndexStore:
+    """Holds the per-media-type indexes, loaded once when the app starts.
+
+    Rebuilt indexes are picked up when the workers restart.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self._indexes = {}
+
+    def load(self, media_type):
+        path = index_path(self.index_dir, media_type)
+        if not os.path.exists(path):
+            return None
+        try:
+            index = TitleIndex.load(path)
+        except Exception as e:
+            logger.error(f"Failed to load {media_type} title index from {path}: {str(e)}")
+            return None
+        self._indexes[media_type] = index
+        logger.info(f"Loaded {media_type} title index with {len(index)} entries")
+        return index
+
+    def get(self, media_type):
+        return self._indexes.get(media_type)
@@ -0,0 +1,176 @@
+import heapq
+import itertools
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Priority classes, lowest value is served first
+INTERACTIVE = 0
+RECOMMENDATION = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    INTERACTIVE: 'interactive',
+    RECOMMENDATION: 'recommendation',
+    BACKGROUND: 'background',
+}
+
+# How long a request may wait for a token before it is shed
+DEFAULT_MAX_WAIT = {
+    INTERACTIVE: 10.0,
+    RECOMMENDATION: 5.0,
+    BACKGROUND: 2.0,
+}
+
+# How many requests of each class may be queued at once
+DEFAULT_MAX_QUEUED = {
+    INTERACTIVE: 64,
+    RECOMMENDATION: 16,
+    BACKGROUND: 4,
+}
+
+
+class TMDBBackpressure(Exception):
+    """Raised when a TMDB request is shed instead of being queued or kept waiting."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value, default=1.0):
+    """Seconds to wait from a Retry-After header given as delta-seconds or an HTTP date."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class TMDBScheduler:
+    """Token bucket shared by every thread of a worker, granting tokens by priority class.
+
+    Waiting requests are served strictly by priority, then arrival. Background requests
+    may only spend tokens above `background_reserve`, so a burst of interactive traffic
+    always finds tokens left and background work is shed first.
+    """
+
+    def __init__(self, rate, burst, background_reserve=None, max_wait=None, max_queued=None):
+        if rate <= 0:
+            raise ValueError(f'TMDB rate limit must be positive, got {rate}')
+        self.rate = float(rate)
+        self.burst = float(burst)
+        reserve = self.burst / 2.0 if background_reserve is None else float(background_reserve)
+        # A grant needs reserve + 1 tokens, which must fit in the bucket
+        self.background_reserve = min(max(0.0, reserve), max(0.0, self.burst - 1.0))
+        self.max_wait = {**DEFAULT_MAX_WAIT, **(max_wait or {})}
+        self.max_queued = {**DEFAULT_MAX_QUEUED, **(max_queued or {})}
+
+        self._condition = threading.Condition()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []  # heap of (priority, seq)
+        self._sequence = itertools.count()
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._stats = {
+            priority: {'granted': 0, 'shed': 0, 'throttled': 0, 'wait_seconds': 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+    def _refill(self, now):
+        # Nothing accrues while paused
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.burst, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+    def _floor(self, priority):
+        return self.background_reserve if priority == BACKGROUND else 0.0
+
+    def _shed(self, priority, message, retry_after=None):
+        self._stats[priority]['shed'] += 1
+        raise TMDBBackpressure(message, retry_after=retry_after)
+
+    def acquire(self, priority=INTERACTIVE):
+        """Block until a token is granted to this request, or raise TMDBBackpressure."""
+        with self._condition:
+            if self._queued[priority] >= self.max_queued[priority]:
+                self._shed(priority, f'TMDB {PRIORITY_NAMES[priority]} queue is full')
+            if self._floor(priority) + 1.0 > self.burst:
+                self._shed(priority, f'TMDB burst is too small for {PRIORITY_NAMES[priority]} requests')
+
+            start = time.monotonic()
+            deadline = start + self.max_wait[priority]
+            waiter = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, waiter)
+            self._queued[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self._paused_until:
+                        ready_at = self._paused_until
+                    elif self._waiters[0] != waiter:
+                        ready_at = None  # Wait for the requests ahead of us to be served
+                    else:
+                        missing = self._floor(priority) + 1.0 - self._tokens
+                        if missing <= 0:
+                            self._tokens -= 1.0
+                            self._stats[priority]['granted'] += 1
+                            self._stats[priority]['wait_seconds'] += now - start
+                            return
+                        ready_at = now + missing / self.rate
+
+                    if ready_at is not None and ready_at > deadline:
+                        self._shed(
+                            priority,
+                            f'TMDB rate limit reached for {PRIORITY_NAMES[priority]} requests',
+                            retry_after=ready_at - now,
+                        )
+                    if now >= deadline:
+                        self._shed(priority, f'Timed out waiting for TMDB {PRIORITY_NAMES[priority]} capacity')
+                    self._condition.wait(min(ready_at or deadline, deadline) - now)
+            finally:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._queued[priority] -= 1
+                self._condition.notify_all()
+
+    def pause(self, seconds, priority=INTERACTIVE):
+        """Stop granting tokens for `seconds`, e.g. after TMDB answered 429 with Retry-After."""
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            self._stats[priority]['throttled'] += 1
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._condition.notify_all()
+
+    def metrics(self):
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'tokens': round(self._tokens, 2),
+                'paused_for': round(max(0.0, self._paused_until - now), 2),
+                'classes': {
+                    name: {
+                        'queued': self._queued[priority],
+                        'granted': self._stats[priority]['granted'],
+                        'shed': self._stats[priority]['shed'],
+                        'throttled': self._stats[priority]['throttled'],
+                        'avg_wait_ms': round(
+                            1000 * self._stats[priority]['wait_seconds'] / self._stats[priority]['granted'], 2
+                        ) if self._stats[priority]['granted'] else 0.0,
+                    }
+                    for priority, name in PRIORITY_NAMES.items()
+                },
+            }